@@ -1,20 +1,26 @@
+import os
 import cv2
 import numpy as np
 from enum import Enum
-from statistics import mode
-from typing import TypeAlias
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Callable, Optional, TypeAlias
 from pycubing.enums import Color, Face
 from pycubing.cube import Cube, Cube3x3
-from math import sqrt, degrees, atan2, tan, radians, dist, sin, cos
+from math import sqrt, degrees, atan2, radians, tan, dist
 
 # type aliases for better type annotations
 Contour: TypeAlias = np.ndarray
+Quadrilaterals: TypeAlias = np.ndarray  # shape (K, 4, 2), one row of corners per quadrilateral contour
 Point: TypeAlias = np.ndarray
 AngleRadians: TypeAlias = float
 AngleDegrees: TypeAlias = float
 
 # constants, tweakable hyperparams
 MAX_IMG_AREA = 2_500_000
+MAX_EDGE_DETECTION_AREA = MAX_IMG_AREA  # lowering this speeds up edge detection, but changes which contours are found
+MAX_VISIBLE_FACES = 3
+FROZEN_VOTE_MARGIN = 10
 ANGLE_DIFF_TOLERANCE = 30   # degrees
 VERTICAL_STD_DEV_TOLERANCE = 20
 HSV_FILTER_COLORS = {  # each value is as follows: (h_ranges, s_range, v_range)
@@ -27,6 +33,17 @@ HSV_FILTER_COLORS = {  # each value is as follows: (h_ranges, s_range, v_range)
 }
 VERTICAL_CHECKING_SHAPE_DIVISOR = 18
 
+# bounds built from HSV_FILTER_COLORS for cv2.inRange, which is inclusive while the ranges above are exclusive on both ends
+COLOR_LIST = np.array([*HSV_FILTER_COLORS.keys(), None], dtype=object)  # index -1 means no color matched
+HSV_BOUNDS = [
+    [((h_low + 1, s_range[0] + 1, v_range[0] + 1), (h_high - 1, s_range[1] - 1, v_range[1] - 1)) for h_low, h_high in h_ranges]
+    for h_ranges, s_range, v_range in HSV_FILTER_COLORS.values()
+]
+
+# whole-frame operations (blur, canny, dilate, hsv conversion) use opencv's own threads, while the per-face
+# contour work it runs serially is spread over a thread pool instead, so the two don't compete for cores
+cv2.setNumThreads(os.cpu_count() or 1)
+
 class FaceLocation(Enum):
     """ Store information regarding where the faces are on the cube, relative to a picture. """
     TOP = 0
@@ -39,9 +56,15 @@ class ComputerVisionException(Exception):
     def __init__(self, message: str) -> None:
         self.message = message
 
-def cap_img(img: cv2.Mat) -> cv2.Mat:
-    """ Caps a given image to a certain size. """
-    scale_factor = min(sqrt(MAX_IMG_AREA / (img.shape[0] * img.shape[1])), 1)
+def get_cap_scale_factor(img: cv2.Mat, max_area: int = MAX_IMG_AREA) -> float:
+    """ Gets the factor an image needs to be scaled by to fit within a maximum area. """
+    return min(sqrt(max_area / (img.shape[0] * img.shape[1])), 1)
+
+def cap_img(img: cv2.Mat, max_area: int = MAX_IMG_AREA) -> cv2.Mat:
+    """ Caps a given image to a certain size, returning the image itself if it is already small enough. """
+    scale_factor = get_cap_scale_factor(img, max_area)
+    if scale_factor == 1:  # a resize by a factor of 1 would only copy the whole image
+        return img
     return cv2.resize(img, (0, 0), fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_AREA)
 
 def imread_capped(filename: str) -> cv2.Mat:
@@ -64,31 +87,23 @@ def get_center(cnt: Contour) -> Point:
     center = (int(moments["m10"] / moments["m00"]), int(moments["m01"] / moments["m00"]))
     return center
 
-# https://stackoverflow.com/a/2259502
-def get_rotated_point(pivot: Point, p: Point, angle: AngleRadians) -> Point:
-    """ Gets a point rotated around a pivot by a given amount of radians. """
-
-    # setup values
-    s = sin(angle)
-    c = cos(angle)
-    adj_y = pivot[1] - p[1]
-    adj_x = p[0] - pivot[0]
-
-    # determine new coordinates
-    new_x = adj_x * c - adj_y * s
-    new_y = adj_x * s + adj_y * c
-    
-    # return new coordinates modified to fit opencv
-    return (int(new_x + pivot[0]), int(pivot[1] - new_y))
-
-# computes the angle between two corners using c1 as the origin
-def compute_incline_angle(c1: Point, c2: Point) -> AngleDegrees:
-    """ Computes the angle of the ray going from c1 to c2. """
-    x_diff, y_diff = c2[0] - c1[0], c1[1] - c2[1]
-    return degrees(atan2(y_diff, x_diff)) % 360 
+def rotate_points(pivot: Point, points: np.ndarray, angle: AngleRadians) -> np.ndarray:
+    """ Rotates an array of points around a pivot by a given amount of radians, keeping the shape of the array. """
+    points = np.asarray(points)
+    rotation_matrix = cv2.getRotationMatrix2D((float(pivot[0]), float(pivot[1])), degrees(angle), 1.0)
+    rotated = cv2.transform(points.reshape(-1, 1, 2).astype(np.float64), rotation_matrix)
+    return rotated.reshape(points.shape).astype(np.int32)
+
+# computes the angles between pairs of corners using the points in c1 as the origins
+def compute_incline_angles(c1: np.ndarray, c2: np.ndarray) -> np.ndarray[AngleDegrees]:
+    """ Computes the angles of the rays going from each point in c1 to the matching point in c2. """
+    x_diff, y_diff = c2[..., 0] - c1[..., 0], c1[..., 1] - c2[..., 1]
+    # math.atan2 is used over np.arctan2, which can differ in the last bit and flip the int() truncations done with these angles
+    angles = np.fromiter(map(atan2, y_diff.ravel().tolist(), x_diff.ravel().tolist()), dtype=np.float64, count=x_diff.size)
+    return np.degrees(angles).reshape(x_diff.shape) % 360
 
 # this function is only used in the following function
-def filter_cubie_contours(img: cv2.Mat, contours: list[Contour], approx: list[Contour]) -> list[Contour]:
+def filter_cubie_contours(img: cv2.Mat, contours: list[Contour], approx: list[Contour]) -> Quadrilaterals:
     """ 
     Filters contours according to the following metrics:
         - Approximation must be 4 points long
@@ -115,152 +130,198 @@ def filter_cubie_contours(img: cv2.Mat, contours: list[Contour], approx: list[Co
         if min(ratio, 1/ratio) < 0.80:   # artitrary ratio thresold chosen by me
             continue
 
-        # make sure the overlapping area isnt too bad
-        overlap_reference = np.zeros(img.shape[:2], dtype=np.uint8)
-        cv2.drawContours(overlap_reference, [cnt], -1, (255, 255, 255), cv2.FILLED)
-        cv2.drawContours(overlap_reference, [appr], -1, (0, 0, 0), cv2.FILLED)
-        if (overlap_reference.sum() // 255) > (cnt_area // 5):
+        # make sure the overlapping area isnt too bad, only drawing within the bounding box of the contour
+        x, y, w, h = cv2.boundingRect(cnt)
+        overlap_reference = np.zeros((h, w), dtype=np.uint8)
+        cv2.drawContours(overlap_reference, [cnt], -1, 255, cv2.FILLED, offset=(-x, -y))
+        cv2.drawContours(overlap_reference, [appr], -1, 0, cv2.FILLED, offset=(-x, -y))
+        if cv2.countNonZero(overlap_reference) > (cnt_area // 5):
             continue
 
         proper_contours.append(cnt) 
         proper_approx.append(appr)
 
     # sweep through it again and cut off the ones that are too small
-    avg_area = np.average([*map(cv2.contourArea, proper_approx)])
-    largest_approx = [*filter(lambda x: cv2.contourArea(x) > avg_area / 4, proper_approx)]
+    quads = np.array(proper_approx, dtype=np.int32).reshape(-1, 4, 2)
+    areas = np.fromiter(map(cv2.contourArea, quads), dtype=np.float64, count=len(quads))
+    largest_quads = quads[areas > (areas.mean() if len(areas) else 0) / 4]
 
     # this time, give each contour a consistent ordering, making it start from the leftmost if possible else bottommost
-    final_approx = []
-    for appr in largest_approx:
-        x_axis_vals = [*map(lambda x: x[0], appr)]
-        min_indices = np.argsort(x_axis_vals)
-        if x_axis_vals[min_indices[1]] - x_axis_vals[min_indices[0]] < img.shape[1] / VERTICAL_CHECKING_SHAPE_DIVISOR:
-            y_axis_vals = [*map(lambda x: x[1], appr)]
-            min_indices = np.argsort(y_axis_vals)
-        final_approx.append(np.concatenate((appr[min_indices[0]:], appr[:min_indices[0]]), axis=0))
-    return final_approx 
-
-def get_cubie_contours(img: cv2.Mat) -> list[Contour]:
+    return roll_to_starting_corner(largest_quads, img.shape[1])
+
+def roll_to_starting_corner(quads: Quadrilaterals, img_width: int) -> Quadrilaterals:
+    """ 
+    Rolls the corners of each quadrilateral so that they start from the left-most corner.
+    If the two left-most corners are close together in terms of x-axis location, the top-most corner is used instead.
     """
-    Given an image, returns a list of contours that are likely to be the "small squares" part of a Rubik's cube.
+    x_order, y_order = np.argsort(quads[..., 0], axis=1), np.argsort(quads[..., 1], axis=1)
+    sorted_x = np.take_along_axis(quads[..., 0], x_order, axis=1)
+    is_vertical = sorted_x[:, 1] - sorted_x[:, 0] < img_width / VERTICAL_CHECKING_SHAPE_DIVISOR
+    starting_corners = np.where(is_vertical, y_order[:, 0], x_order[:, 0])
+    return np.take_along_axis(quads, ((starting_corners[:, None] + np.arange(4)) % 4)[..., None], axis=1)
+
+@lru_cache(maxsize=8)
+def get_edge_detection_params(shape: tuple[int, ...]) -> tuple[tuple[int, int], int, np.ndarray, int]:
+    """ 
+    Computes the blur size, blur sigma, dilation kernel and minimum contour area for an image of the given shape.
+    These only depend on the shape, so they are cached across frames of the same size.
     """
-
-    # computes some sizes - doesn't get too crazy because sizes are standardized
-    reference_size = max(img.shape)
+    reference_size = max(shape)  # doesn't get too crazy because sizes are standardized
     blur_size = int(sqrt(reference_size) / 2)
     kernel_size = int(sqrt(reference_size) / 10)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size * 3,) * 2)
+    return (blur_size + int(blur_size % 2 == 0),) * 2, kernel_size, kernel, (shape[0] * shape[1]) // 5000
+
+def get_cubie_contours(img: cv2.Mat) -> Quadrilaterals:
+    """
+    Given an image, returns a list of contours that are likely to be the "small squares" part of a Rubik's cube.
+    """
+
+    # edges are detected on a smaller copy of the image, the contours are scaled back up afterwards
+    scale_factor = get_cap_scale_factor(img, MAX_EDGE_DETECTION_AREA)
+    small_img = cap_img(img, MAX_EDGE_DETECTION_AREA)
 
     # image processing to get contours
-    blur = cv2.GaussianBlur(img, (blur_size + int(blur_size % 2 == 0),) * 2, kernel_size)
+    blur_size, blur_sigma, kernel, min_area = get_edge_detection_params(small_img.shape)
+    blur = cv2.GaussianBlur(small_img, blur_size, blur_sigma)
     edges = cv2.Canny(blur, 20, 30)
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size * 3,) * 2)
     dilated = cv2.dilate(edges, kernel)
     contours = cv2.findContours(dilated, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
-    large_contours = [*filter(lambda x: cv2.contourArea(x, True) > (img.shape[0] * img.shape[1]) // 5000, contours)]
+    large_contours = [*filter(lambda x: cv2.contourArea(x, True) > min_area, contours)]
     approx = [*map(lambda x: cv2.approxPolyDP(x, 0.03*cv2.arcLength(x, True), True).reshape(-1, 2), large_contours)]
+
+    # bring the contours back to the size of the original image
+    if scale_factor != 1:
+        large_contours = [(cnt / scale_factor).astype(np.int32) for cnt in large_contours]
+        approx = [(appr / scale_factor).astype(np.int32) for appr in approx]
     
     # filter the contours
     return filter_cubie_contours(img, large_contours, approx)
 
-def get_squares_by_angle(squares: list[Contour]) -> dict[tuple[float], list[Contour]]:
+def get_squares_by_angle(squares: Quadrilaterals) -> dict[tuple[float], Quadrilaterals]:
     """ Returns a map of angle-pairs to a list of squares. This is done to seperate them into faces. """
 
-    # determine an angle between specific points on the contour 
-    angle_to_squares = {}
-    for appr in squares:
-        appr = appr.reshape(-1, 2)
-        c1, c2, c3 = appr[0], appr[1], appr[-1]  # we can specifically index here because of the ordering done in the prev function
-        angle_of_incline1 = compute_incline_angle(c1, c2)
-        angle_of_incline2 = compute_incline_angle(c3, c1)
-        for (k1, k2), v in angle_to_squares.items():
-            if abs(angle_of_incline1 - k1) < ANGLE_DIFF_TOLERANCE and abs(angle_of_incline2 - k2) < ANGLE_DIFF_TOLERANCE:
-
-                # add to list of contours 
-                v.append(appr)
-                current_total = len(v) - 1
-
-                # replace the key with the new average
-                del angle_to_squares[(k1, k2)]
-                angle_to_squares[((k1 * current_total + angle_of_incline1) / (current_total + 1), 
-                                  (k2 * current_total + angle_of_incline2) / (current_total + 1))] = v
-                break
+    # determine angles between specific points on every contour at once
+    # we can specifically index here because of the ordering done in the prev function
+    angles = np.stack([compute_incline_angles(squares[:, 0], squares[:, 1]), 
+                       compute_incline_angles(squares[:, -1], squares[:, 0])], axis=1)
+
+    # assign each contour to the first group with similar angles, keeping each group's angles as a running average
+    # groups are checked in the order they were last added to, so that they line up with the order they are returned in
+    centroids = np.empty_like(angles)
+    counts = np.zeros(len(squares), dtype=int)
+    last_added = np.zeros(len(squares), dtype=int)
+    labels = np.empty(len(squares), dtype=int)
+    group_total = 0
+    for i, angle_pair in enumerate(angles):
+        matches = np.flatnonzero((np.abs(centroids[:group_total] - angle_pair) < ANGLE_DIFF_TOLERANCE).all(axis=1))
+        if matches.size:
+            group = matches[np.argmin(last_added[matches])]
+            centroids[group] += (angle_pair - centroids[group]) / (counts[group] + 1)
         else:
-            angle_to_squares[(angle_of_incline1, angle_of_incline2)] = [appr]
+            group = group_total
+            centroids[group] = angle_pair
+            group_total += 1
+        counts[group] += 1
+        last_added[group] = i
+        labels[i] = group
+    angle_to_squares = {
+        tuple(centroids[group]): squares[labels == group]
+        for group in np.argsort(last_added[:group_total])
+    }
 
     # raise a red flag if only one side was detected -- assuming the user did everything correctly, this incicates the unique case
     if len(angle_to_squares) == 1:
 
         # we need to split the cube into two parts, across a diagonal line
         pivot_point = (400, 400)
-        average_angle = radians(np.average([compute_incline_angle(c1, c2) for (c1, c2, _, _) in squares]))
-        rotated_centers = [get_rotated_point(pivot_point, get_center(appr), -average_angle) for appr in squares]
-        if ((max_y := max(map(lambda x: x[1], rotated_centers))) - (min_y := min(map(lambda x: x[1], rotated_centers))) > 
-            (max_x := max(map(lambda x: x[0], rotated_centers))) - (min_x := min(map(lambda x: x[0], rotated_centers)))):
-            midline = (max_y + min_y) / 2
-            comp_function = lambda x: x[1]
-        else:
-            midline = (max_x + min_x) / 2
-            comp_function = lambda x: x[0]
-        group_lower = [c for c, rc in zip(squares, rotated_centers) if comp_function(rc) < midline]
-        group_upper = [c for c, rc in zip(squares, rotated_centers) if comp_function(rc) > midline]
+        average_angle = radians(angles[:, 0].mean())
+        rotated_centers = rotate_points(pivot_point, np.array([get_center(appr) for appr in squares]), -average_angle)
+        max_x, max_y = rotated_centers.max(axis=0)
+        min_x, min_y = rotated_centers.min(axis=0)
+        split_coords = rotated_centers[:, 1] if max_y - min_y > max_x - min_x else rotated_centers[:, 0]
+        midline = (split_coords.max() + split_coords.min()) / 2
         angle_to_squares = {  # the angle choice here doesn't really matter
-            (0, 0): group_lower,
-            (69, 69): group_upper
+            (0, 0): squares[split_coords < midline],
+            (69, 69): squares[split_coords > midline]
         }
 
     return angle_to_squares
 
 # helper function for the next one
-def fill_line_through_contour(intersection_map: cv2.Mat, center: Point, mid_corner: Point, ang_ref_corner: Point, thick_ref_corner: Point) -> None:
-    """ Draws a thick line through a contour on a given image using given reference points. """
+def fill_lines_through_contours(intersection_map: cv2.Mat, centers: np.ndarray, mid_corners: np.ndarray, 
+                                ang_ref_corners: np.ndarray, thick_ref_corners: np.ndarray) -> None:
+    """ Draws a thick line through each contour on a given image using given reference points, one row per contour. """
 
     # determine angles for use later
-    line_angle = radians(compute_incline_angle(mid_corner, ang_ref_corner))
-    thick_ref_angle = radians(compute_incline_angle(mid_corner, thick_ref_corner))
+    line_angles = np.radians(compute_incline_angles(mid_corners, ang_ref_corners))
+    thick_ref_angles = np.radians(compute_incline_angles(mid_corners, thick_ref_corners))
+    tans = np.fromiter(map(tan, line_angles.tolist()), dtype=np.float64, count=len(line_angles))  # math.tan, as np.tan can move an endpoint by a pixel
+    height, width = intersection_map.shape[:2]
+    center_x, center_y = centers[:, 0], centers[:, 1]
 
     # compute locations of bounding points by extrapolating using the angle   -- TODO: consider changing the angle to be the average angle at that spot, eliminate noise
-    point1 = (0, tan(line_angle)*center[0] + center[1])
-    point2 = (intersection_map.shape[1], center[1] - tan(line_angle)*(intersection_map.shape[1]-center[0]))
+    points1 = np.stack([np.zeros_like(tans), tans*center_x + center_y], axis=1)
+    points2 = np.stack([np.full_like(tans, width), center_y - tans*(width-center_x)], axis=1)
 
-    # adjust this to use the x-direction instead
-    if abs(point1[1]) > 10000:
-        point1 = (center[1] / tan(line_angle) + center[0], 0)
-        point2 = (- (intersection_map.shape[0] - center[1]) / tan(line_angle) + center[0], intersection_map.shape[0])
+    # adjust this to use the x-direction instead, for lines that are too steep
+    with np.errstate(divide="ignore"):
+        x_direction_points1 = np.stack([center_y / tans + center_x, np.zeros_like(tans)], axis=1)
+        x_direction_points2 = np.stack([- (height - center_y) / tans + center_x, np.full_like(tans, height)], axis=1)
+    too_steep = (np.abs(points1[:, 1]) > 10000)[:, None]
+    points1 = np.where(too_steep, x_direction_points1, points1).astype(int)
+    points2 = np.where(too_steep, x_direction_points2, points2).astype(int)
 
     # determine the thickness using the angle of difference in the parallelogram, and plot to the map
-    thickness = int(dist(mid_corner, thick_ref_corner) * abs(sin(thick_ref_angle - line_angle)))
-    cv2.line(intersection_map, [*map(int, point1)], [*map(int, point2)], 100, thickness // 2)  # thickness is adjusted to avoid potential overlap of squares
+    ref_distances = np.fromiter(map(dist, mid_corners.tolist(), thick_ref_corners.tolist()), dtype=np.float64, count=len(mid_corners))  # same for np.hypot
+    thicknesses = (ref_distances * np.abs(np.sin(thick_ref_angles - line_angles))).astype(int)
+    for point1, point2, thickness in zip(points1.tolist(), points2.tolist(), thicknesses.tolist()):
+        cv2.line(intersection_map, point1, point2, 100, thickness // 2)  # thickness is adjusted to avoid potential overlap of squares
+
+def interpolate_face_squares(squares: Quadrilaterals, scratch_masks: np.ndarray) -> Quadrilaterals:
+    """ Interpolates the squares of a single face, using two single-channel masks the size of the image. """
+
+    # fill intersection maps for each deteced piece, showing all possible pieces
+    c1_c2_intersection_map, c2_c3_intersection_map = scratch_masks
+    c1_c2_intersection_map.fill(0)
+    c2_c3_intersection_map.fill(0)
+    centers = np.array([get_center(cnt) for cnt in squares]).reshape(-1, 2)
+    c1, c2, c3 = squares[:, :-1].transpose(1, 0, 2)
+    fill_lines_through_contours(c1_c2_intersection_map, centers, c2, c3, c1)
+    fill_lines_through_contours(c2_c3_intersection_map, centers, c2, c1, c3)
+    
+    # determine a final map and new contours that are completely accurate to the cube
+    final_map = np.add(c1_c2_intersection_map, c2_c3_intersection_map, out=c1_c2_intersection_map)
+    thresh = cv2.threshold(final_map, 199, 255, cv2.THRESH_BINARY, dst=c2_c3_intersection_map)[1]
+    # slivers where the lines barely cross are dropped before they are approximated, as they are never squares
+    min_area = thresh.size // 2000
+    new_squares = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]  # the blobs have no holes, so only outer contours matter
+    new_squares = [*filter(lambda x: cv2.contourArea(x) > min_area / 2, new_squares)]
+    new_approx = [*map(lambda x: cv2.approxPolyDP(x, 0.03*cv2.arcLength(x, True), True).reshape(-1, 2), new_squares)]  # reshape makes it from (-1, 1, 2) to (-1, 2)
+    new_quads = [*filter(lambda x: len(x) == 4 and cv2.contourArea(x) > min_area, new_approx)]
+    return np.array(new_quads, dtype=np.int32).reshape(-1, 4, 2)
 
 # after this, squares should be fully read
-def fill_empty_squares(img: cv2.Mat, face_contours: dict[tuple[float], list[Contour]]):
+def fill_empty_squares(img: cv2.Mat, face_contours: dict[tuple[float], Quadrilaterals], 
+                       scratch_masks: Optional[np.ndarray] = None, 
+                       executor: Optional[Executor] = None) -> dict[tuple[float], Quadrilaterals]:
     """
     Interpolates where squares are, if the squares are not read yet. 
     View the cv_testing.ipynb file to see what this looks like for better understanding.
+    Pairs of single-channel masks the size of the image, one per face, can be given in `scratch_masks` to avoid allocating them.
+    If an `executor` is given, the faces are interpolated concurrently on it.
     """
 
-    new_face_contours = {}
-    for key, squares in face_contours.items():
-
-        # fill intersection maps for each deteced piece, showing all possible pieces
-        c1_c2_intersection_map = np.zeros(img.shape[:2], dtype=np.uint8)
-        c2_c3_intersection_map = np.zeros(img.shape[:2], dtype=np.uint8)
-        for cnt in squares:
-            center = get_center(cnt)
-            c1, c2, c3 = cnt[:-1]
-            fill_line_through_contour(c1_c2_intersection_map, center, c2, c3, c1)
-            fill_line_through_contour(c2_c3_intersection_map, center, c2, c1, c3)
-        
-        # determine a final map and new contours that are completely accurate to the cube
-        final_map = c1_c2_intersection_map + c2_c3_intersection_map
-        thresh = cv2.threshold(final_map, 199, 255, cv2.THRESH_BINARY)[1]
-        new_squares = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
-        new_approx = [*map(lambda x: cv2.approxPolyDP(x, 0.03*cv2.arcLength(x, True), True).reshape(-1, 2), new_squares)]  # reshape makes it from (-1, 1, 2) to (-1, 2)
-        new_face_contours[key] = [*filter(lambda x: len(x) == 4 and cv2.contourArea(x) > np.prod(img.shape[:2]) // 2000, new_approx)]
+    if scratch_masks is None or len(scratch_masks) < len(face_contours):
+        scratch_masks = np.empty((len(face_contours), 2, *img.shape[:2]), dtype=np.uint8)
 
-    return new_face_contours
+    # each face gets its own masks, so the faces don't depend on each other
+    face_map = map if executor is None else executor.map
+    new_squares = face_map(interpolate_face_squares, face_contours.values(), scratch_masks)
+    return dict(zip(face_contours.keys(), new_squares))
 
 # this is probably where a lot of things go wrong, ive tried to add a lot of checks tho 
-def get_squares_by_face(face_contours: dict[tuple[float], list[Contour]]) -> dict[FaceLocation, list[Contour]]:
+def get_squares_by_face(face_contours: dict[tuple[float], Quadrilaterals]) -> dict[FaceLocation, Quadrilaterals]:
     """
     Identifies which locations in the picture contain which faces.
     The input is a dictionary of keys (which are tuples of float) to contours, where each key represents a face.
@@ -286,9 +347,12 @@ def get_squares_by_face(face_contours: dict[tuple[float], list[Contour]]) -> dic
     
     # remove blank keys
     for key in list(face_contours.keys()):
-        if not face_contours[key]:
+        if not len(face_contours[key]):
             del face_contours[key]
 
+    # compute the center of each contour once, as it is needed several times below - the corner average is the center of a parallelogram
+    centers = {key: squares.mean(axis=1) for key, squares in face_contours.items()}
+
     # check if the number if face contours is 0, if so, we only have two options
     if len(face_contours) < 2:
         raise ComputerVisionException("Too few faces detected.")
@@ -299,29 +363,31 @@ def get_squares_by_face(face_contours: dict[tuple[float], list[Contour]]) -> dic
         # determine average angle of going top 
         top_right_angle = 0
         for key, squares in face_contours.items():
-            left_most_indices = [np.argsort([*map(lambda x: x[0], cnt)])[0] for cnt in squares]
-            angle_points = [[cnt[i], cnt[(i-1) % 4]] for cnt, i in zip(squares, left_most_indices)]
-            top_right_angle += np.average([compute_incline_angle(left, top) for left, top in angle_points])
+            left_most_indices = np.argsort(squares[..., 0], axis=1)[:, 0]
+            square_indices = np.arange(len(squares))
+            left_points, top_points = squares[square_indices, left_most_indices], squares[square_indices, (left_most_indices - 1) % 4]
+            top_right_angle += compute_incline_angles(left_points, top_points).mean()
         top_right_angle = np.radians(top_right_angle / 2)
 
-        # determine the left_most contour 
+        # determine the left_most contour, rotating all the points at once and splitting them back up by face
         pivot_point = (400, 400)  # arbitrary - relative locations remain the same
-        rotated_face_contours = {
-            k: [[get_rotated_point(pivot_point, p, -top_right_angle) for p in cnt] for cnt in squares]
-            for k, squares in face_contours.items()
-        }
+        face_points = [*face_contours.values()]
+        rotated_points = rotate_points(pivot_point, np.concatenate(face_points), -top_right_angle)
+        rotated_face_contours = dict(zip(face_contours.keys(), np.split(rotated_points, [len(face_points[0])])))
 
         # determine if the contours are significantly above or below each other
         key_1, key_2 = face_contours.keys()
-        center_of_mass_1, center_of_mass_2 = map(lambda k: np.average([get_center(np.array(cnt)) for cnt in rotated_face_contours[k]], axis=0), [key_1, key_2])
-        if len({center_of_mass_1[0] > get_center(np.array(cnt))[0] for cnt in rotated_face_contours[key_2]}) == 1:  # the key1 is more to the left or right than key
+        rotated_centers = {k: contours.mean(axis=1) for k, contours in rotated_face_contours.items()}
+        center_of_mass_1, center_of_mass_2 = rotated_centers[key_1].mean(axis=0), rotated_centers[key_2].mean(axis=0)
+        is_left_of_key_2 = center_of_mass_1[0] > rotated_centers[key_2][:, 0]
+        if is_left_of_key_2.all() or not is_left_of_key_2.any():  # the key1 is more to the left or right than key
 
             # here, we make sure key_1 is always the leftmost key for returning
             if center_of_mass_2[0] < center_of_mass_1[0]:
                 key_1, key_2 = key_2, key_1
 
             # some guardrails to make sure we don't get results that make no sense
-            bottom_center_of_mass, right_center_of_mass = map(lambda k: np.average([get_center(np.array(cnt)) for cnt in face_contours[k]], axis=0), [key_1, key_2])
+            bottom_center_of_mass, right_center_of_mass = centers[key_1].mean(axis=0), centers[key_2].mean(axis=0)
             if not (bottom_center_of_mass[1] > right_center_of_mass[1] and right_center_of_mass[0] > bottom_center_of_mass[0]):
                 raise ComputerVisionException("Invalid faces detected.")
             return {
@@ -334,7 +400,7 @@ def get_squares_by_face(face_contours: dict[tuple[float], list[Contour]]) -> dic
 
             if center_of_mass_2[1] < center_of_mass_1[1]:
                 key_1, key_2 = key_2, key_1
-            bottom_center_of_mass, left_center_of_mass = map(lambda k: np.average([get_center(np.array(cnt)) for cnt in face_contours[k]], axis=0), [key_2, key_1])
+            bottom_center_of_mass, left_center_of_mass = centers[key_2].mean(axis=0), centers[key_1].mean(axis=0)
             if not (bottom_center_of_mass[1] > left_center_of_mass[1] and left_center_of_mass[0] < bottom_center_of_mass[0]):
                 raise ComputerVisionException("Invalid faces detected.")
             return {
@@ -347,34 +413,33 @@ def get_squares_by_face(face_contours: dict[tuple[float], list[Contour]]) -> dic
         for key, squares in face_contours.items():
 
             # storing left-side points and right-side points for each contour
-            sorted_left_to_right = [sorted(cnt, key=lambda p: p[0]) for cnt in squares]
-            left_side_points = [sorted(points[:2], key=lambda p: p[1]) for points in sorted_left_to_right]    # sorting these two top to bottom for consistency
-            right_side_points = [sorted(points[2:], key=lambda p: p[1]) for points in sorted_left_to_right]
+            sorted_left_to_right = np.take_along_axis(squares, np.argsort(squares[..., 0], axis=1, kind="stable")[..., None], axis=1)
+            left_side_points, right_side_points = (  # sorting these two top to bottom for consistency
+                np.take_along_axis(points, np.argsort(points[..., 1], axis=1, kind="stable")[..., None], axis=1)
+                for points in (sorted_left_to_right[:, :2], sorted_left_to_right[:, 2:])
+            )
             left_right_side_points[key] = (left_side_points, right_side_points)
 
             # get the average angle figured out, if its pretty much vertical its on the left/right face
-            angles = [compute_incline_angle(*points) % 180 for points in left_side_points + right_side_points]
-            if 90 - ANGLE_DIFF_TOLERANCE < np.average(angles) < 90 + ANGLE_DIFF_TOLERANCE and np.std(angles) < VERTICAL_STD_DEV_TOLERANCE:  # this means we have detected a mostly vertical angle group
+            angles = np.concatenate([compute_incline_angles(points[:, 0], points[:, 1]) % 180 
+                                     for points in (left_side_points, right_side_points)])
+            if 90 - ANGLE_DIFF_TOLERANCE < np.mean(angles) < 90 + ANGLE_DIFF_TOLERANCE and np.std(angles) < VERTICAL_STD_DEV_TOLERANCE:  # this means we have detected a mostly vertical angle group
                 left_right_keys.append(key)
 
             # determine the center of mass for the things
-            center_of_mass = np.average([get_center(cnt) for cnt in squares], axis=0)
-            center_of_masses[key] = center_of_mass
+            center_of_masses[key] = centers[key].mean(axis=0)
 
         # determine the left key from looking at where the center is 
         try:
-            left_key, right_key = sorted(left_right_keys, key=lambda k: center_of_masses[k][0])
+            left_key, right_key = (left_right_keys[i] for i in np.argsort([center_of_masses[k][0] for k in left_right_keys]))
         except ValueError:  # cannot unpack the values, so there were not enough proper faces detected
             raise ComputerVisionException("Something went wrong.")
 
         # meaning: left_right means the left face, right line. we are checking if the left face right line is higher/lower than the left face left line
-        left_left_avg, left_right_avg, right_left_avg, right_right_avg = map(
-            lambda points_group: np.array([np.average([*map(lambda x: x[1], points)]) for points in points_group]), [
-                left_right_side_points[left_key][0], left_right_side_points[left_key][1], 
-                left_right_side_points[right_key][0], left_right_side_points[right_key][1]
-            ]
+        left_left_avg, left_right_avg, right_left_avg, right_right_avg = (
+            points[..., 1].mean(axis=1) for points in (*left_right_side_points[left_key], *left_right_side_points[right_key])
         )
-        total_diff = np.average(left_left_avg - left_right_avg) + np.average(right_right_avg - right_left_avg)
+        total_diff = (left_left_avg - left_right_avg).mean() + (right_right_avg - right_left_avg).mean()
         top_or_bottom_face_loc = FaceLocation.BOTTOM if total_diff > 0 else FaceLocation.TOP
         top_or_bottom_key = (set(face_contours.keys()) - {left_key, right_key}).pop()
 
@@ -403,26 +468,33 @@ def get_extreme_diff(channel: np.ndarray) -> np.ndarray:
     return cv2.normalize(diff, None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8UC1)
 
 # this is only used to make the image less shadowy for the determine_face_colors function
-def remove_shadows(img: cv2.Mat) -> cv2.Mat:
-    """ Removes the shadows from a given image, returning a new image. """
-    hsv_img = to_hsv(img)
-    h, s, v = cv2.split(hsv_img)
-    new_img = cv2.merge([h, s, get_extreme_diff(v)])
-    return new_img
-
-# gets the color at a given point, assuming it is one of the colors in the HSV range
-def get_color(hsv_img: cv2.Mat, p: Point) -> Color:
-    """ Gets the color at a given point in the `hsv_img`. """
-    hsv_pixel = hsv_img[p[1], p[0]]
-    for color, (h_ranges, *other_ranges) in HSV_FILTER_COLORS.items():
-        for h_range in h_ranges:
-            if all([x > x_range[0] and x < x_range[1] for x, x_range in zip(hsv_pixel, [h_range, *other_ranges])]):
-                return color
-    return None
+def remove_shadows(img: cv2.Mat, hsv_buffer: Optional[np.ndarray] = None) -> cv2.Mat:
+    """ Removes the shadows from a given image, returning an HSV image written to `hsv_buffer` if given, otherwise a new one. """
+    hsv_img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=hsv_buffer)
+    hsv_img[:, :, 2] = get_extreme_diff(hsv_img[:, :, 2])
+    return hsv_img
+
+# colors are stored as small integers while voting, using their index in COLOR_LIST
+def get_color_ids(hsv_img: cv2.Mat, points: np.ndarray) -> np.ndarray:
+    """ Gets the id of the color at each of the given points in the `hsv_img` as an int8 array, where -1 means no color matches. """
+    points = np.asarray(points, dtype=np.intp).reshape(-1, 2)
+    samples = hsv_img[points[:, 1], points[:, 0]].reshape(1, -1, 3)
+
+    # each row holds the colors that the pixel matches, the first one in HSV_FILTER_COLORS order is picked
+    matches = np.stack([
+        np.logical_or.reduce([cv2.inRange(samples, low, high)[0] for low, high in bounds]) for bounds in HSV_BOUNDS
+    ], axis=1)
+    return np.where(matches.any(axis=1), matches.argmax(axis=1), -1).astype(np.int8)
 
 # basically the last thing done in the pipeline
-def determine_face_colors(img: cv2.Mat, squares_by_face: dict[FaceLocation, list[Contour]]) -> dict[FaceLocation, np.ndarray[Color]]:
-    """ Determines an array of Colors for each FaceLocation in the given dictionary. """
+def determine_face_colors(img: cv2.Mat, squares_by_face: dict[FaceLocation, Quadrilaterals], 
+                          hsv_buffer: Optional[np.ndarray] = None) -> dict[FaceLocation, np.ndarray[Color]]:
+    """ Determines an array of Colors for each FaceLocation in the given dictionary, optionally reusing `hsv_buffer` for the HSV image. """
+    return {face: COLOR_LIST[color_ids] for face, color_ids in determine_face_color_ids(img, squares_by_face, hsv_buffer).items()}
+
+def determine_face_color_ids(img: cv2.Mat, squares_by_face: dict[FaceLocation, Quadrilaterals], 
+                             hsv_buffer: Optional[np.ndarray] = None) -> dict[FaceLocation, np.ndarray]:
+    """ Same as determine_face_colors, but gives int8 color ids (see get_color_ids) instead of Colors. """
     
     # determine the size of the cube 
     N = sqrt(max(map(len, squares_by_face.values())))
@@ -430,7 +502,7 @@ def determine_face_colors(img: cv2.Mat, squares_by_face: dict[FaceLocation, list
         raise ComputerVisionException("Invalid cube detected. Squares per side is not a perfect square.")
     
     # save an hsv version of the image with removed shadows for use within the code
-    removed_shadows = remove_shadows(img)
+    removed_shadows = remove_shadows(img, hsv_buffer)
 
     face_to_colors = {}
     for face, squares in squares_by_face.items():
@@ -440,22 +512,16 @@ def determine_face_colors(img: cv2.Mat, squares_by_face: dict[FaceLocation, list
             continue
         
         # let the pivot point be the top-most corner of the cube, and find an arbitrary average angle to straighten by 
-        pivot_point = min([min(cnt, key=lambda x: x[1]) for cnt in squares], key=lambda x: x[1])
-        angles = [compute_incline_angle(*cnt[:2]) for cnt in squares]
+        all_points = squares.reshape(-1, 2)
+        pivot_point = all_points[np.argmin(all_points[:, 1])]
+        angles = compute_incline_angles(squares[:, 0], squares[:, 1])
         if np.std(angles) > ANGLE_DIFF_TOLERANCE:  # tries again to get more consistent angles, by giving points a better order
-            second_try_squares = []
-            for cnt in squares:
-                x_axis_vals = [*map(lambda x: x[0], cnt)]
-                max_index = np.argsort(x_axis_vals)
-                if x_axis_vals[max_index[1]] - x_axis_vals[max_index[0]] < img.shape[1] / VERTICAL_CHECKING_SHAPE_DIVISOR:
-                    y_axis_vals = [*map(lambda x: x[1], cnt)]
-                    max_index = np.argsort(y_axis_vals)
-                second_try_squares.append(np.concatenate((cnt[max_index[0]:], cnt[:max_index[0]]), axis=0))
-            angles = [compute_incline_angle(*cnt[:2]) for cnt in second_try_squares]
-        average_angle = radians(np.average(angles))
+            second_try_squares = roll_to_starting_corner(squares, img.shape[1])
+            angles = compute_incline_angles(second_try_squares[:, 0], second_try_squares[:, 1])
+        average_angle = radians(angles.mean())
 
         # calculate new, rotated images to use
-        new_contours = np.array([[get_rotated_point(pivot_point, p, -average_angle) for p in cnt] for cnt in squares])
+        new_contours = rotate_points(pivot_point, squares, -average_angle)
 
         # sort the centers top to bottom, then insert the address of each contour into the thing
         centers_with_index = [(i, get_center(cnt)) for i, cnt in enumerate(new_contours)]
@@ -466,15 +532,22 @@ def determine_face_colors(img: cv2.Mat, squares_by_face: dict[FaceLocation, list
         ] for i in range(N)]
         
         # now that we have determined what indeces of the squares list to look at, we can determine the color at each place
-        face_to_colors[face] = np.array([[
-            get_color(removed_shadows, get_center(squares[face_contour_map[i][j]]))
-            for j in range(N)
-        ] for i in range(N)])
+        centers = [get_center(squares[face_contour_map[i][j]]) for i in range(N) for j in range(N)]
+        face_to_colors[face] = get_color_ids(removed_shadows, centers).reshape(N, N)
     return face_to_colors
 
+# used to move a face read from a picture onto the cube
+def transform_face_guess(face_guess: np.ndarray, rotation: int, flip: bool) -> np.ndarray:
+    """ Rotates a face guess by `rotation` quarter turns counterclockwise, mirroring it horizontally afterwards if `flip` is set. """
+    rotated_guess = np.rot90(face_guess, rotation)
+    return rotated_guess[:, ::-1] if flip else rotated_guess
+
 # this is the class that brings everything together, and what interacts with the outside
 class ImageToCube:
 
+    # instances are touched on every frame, so their attributes are fixed up front
+    __slots__ = ("state", "color_counts", "first_seen", "guess_counts", "frozen_faces", "N", "_scratch_masks", "_hsv_buffer", "_executor")
+
     # we must spend at least these frames on a new orientation to consider it individual 
     ROTATION_ORDER: list[tuple[dict[FaceLocation, tuple[Face, int]]]] = [
         {FaceLocation.TOP: (Face.TOP, -1), FaceLocation.RIGHT: (Face.RIGHT, 2), FaceLocation.LEFT: (Face.FRONT, -1)},
@@ -485,68 +558,81 @@ class ImageToCube:
         {FaceLocation.BOTTOM: (Face.FRONT, -1), FaceLocation.LEFT: (Face.LEFT, -1), FaceLocation.RIGHT: (Face.TOP, -1)}
     ]
 
+    # the same states flattened into (face_loc, cube_face, transform) rows, built once since they are read every frame
+    ROTATION_TABLE: tuple[tuple[tuple[FaceLocation, Face, Callable[[np.ndarray], np.ndarray]]]] = tuple(
+        tuple((face_loc, cube_face, partial(transform_face_guess, rotation=rotation, flip=cube_face == Face.BOTTOM))
+              for face_loc, (cube_face, rotation) in state.items())
+        for state in ROTATION_ORDER
+    )
+
     def __init__(self, N: int):
 
         # store which state of ROTATION_ORDER is being looked at
         self.state = 0
 
         # information about the cube
-        self.cube_guesses = [np.empty((N, N, 1), dtype=object) for _ in range(6)]
+        # votes for each color id (see get_color_ids) in every square, and the guess number each color was first seen at
+        self.color_counts = np.zeros((6, N, N, len(COLOR_LIST) - 1), dtype=np.int32)
+        self.first_seen = np.zeros((6, N, N, len(COLOR_LIST) - 1), dtype=np.int32)
+        self.guess_counts = [0] * 6
+        self.frozen_faces = [False] * 6  # faces that have settled stop taking votes
         self.N = N
+
+        # buffers the size of a frame that are reused between frames, allocated once the frame size is known
+        self._scratch_masks: Optional[np.ndarray] = None
+        self._hsv_buffer: Optional[np.ndarray] = None
+
+        # the faces of a frame are independent of each other, so they are processed concurrently
+        self._executor = ThreadPoolExecutor(max_workers=MAX_VISIBLE_FACES)
+
+    def get_frame_buffers(self, img: cv2.Mat) -> tuple[np.ndarray, np.ndarray]:
+        """ Gets the scratch masks and HSV buffer for a frame, reallocating them only if the frame size changed. """
+        if self._hsv_buffer is None or self._hsv_buffer.shape != img.shape:
+            self._scratch_masks = np.empty((MAX_VISIBLE_FACES, 2, *img.shape[:2]), dtype=np.uint8)
+            self._hsv_buffer = np.empty_like(img)
+        return self._scratch_masks, self._hsv_buffer
     
-    def calculate_score(self, state: int, colors_by_face: dict[FaceLocation, list[list[Color]]]) -> float:
-        """ Calculate the score for how well a state matches given colors_by_face. """
+    def calculate_score(self, state: int, colors_by_face: dict[FaceLocation, np.ndarray]) -> float:
+        """ Calculate the score for how well a state matches given colors_by_face, which holds color ids. """
         
         scores = []
-        for face_loc, (cube_face, rotation) in ImageToCube.ROTATION_ORDER[state % 6].items():
+        for face_loc, cube_face, transform in ImageToCube.ROTATION_TABLE[state % 6]:
 
             # get current guess
             if face_loc not in colors_by_face:
                 continue
-            incoming_face_guess = ImageToCube.interpret_face_guess(cube_face, rotation, colors_by_face[face_loc])
+            incoming_face_guess = transform(colors_by_face[face_loc])
             overall_face_guess = self.get_guess(cube_face)
 
-            # assign scores to different scenarios 
-            running_score_total = 0
-            for i in range(self.N):
-                for j in range(self.N):
-
-                    # either square is none, | operator prevents short circuiting
-                    if (inc_none := incoming_face_guess[i, j] is None) | (ove_none := overall_face_guess[i, j] is None):  
-                        if ove_none and inc_none:
-                            running_score_total += 0.5
-                        elif ove_none:
-                            running_score_total += 0.7
-                        else:
-                            running_score_total += 0.45
-
-                    # check equality
-                    elif incoming_face_guess[i, j] == overall_face_guess[i, j]:
-                        running_score_total += 1.0
+            # assign scores to different scenarios, where either square can be none
+            incoming_none, overall_none = incoming_face_guess == -1, overall_face_guess == -1
+            square_scores = np.select(
+                [incoming_none & overall_none, overall_none, incoming_none, incoming_face_guess == overall_face_guess],
+                [0.5, 0.7, 0.45, 1.0], 0.0
+            )
 
+            # summed square by square, as states are compared with exact ties and the order of float additions matters
+            running_score_total = np.cumsum(square_scores)[-1]
             scores.append(running_score_total / (self.N * self.N))
 
         # determine how many matched faces are there compared to how many faces were read
         score_modifier = (len(scores) / len(colors_by_face)) * 0.2
-        return (np.average(scores) if scores else 0) + score_modifier
-
-    @staticmethod
-    def interpret_face_guess(cube_face: Face, rotation: int, current_face_guess: np.ndarray[Color]) -> np.ndarray[Color]:
-        """ Given a current_face_guess, transform it to how it would be on the cube given values for rotation and cube_face. """
-        rotated_guess = np.rot90(current_face_guess, rotation)
-        if cube_face == Face.BOTTOM:
-            return np.flip(rotated_guess, axis=1)
-        return rotated_guess
+        return (np.mean(scores) if scores else 0) + score_modifier
 
     def translate(self, img: cv2.Mat):  # assume the image is already in low res
 
+        # nothing left to read once every face has settled
+        if all(self.frozen_faces):
+            return
+
         # run through image processing process
+        scratch_masks, hsv_buffer = self.get_frame_buffers(img)
         try:
             cubie_contours = get_cubie_contours(img)
             squares_by_angle = get_squares_by_angle(cubie_contours)
-            interpolated_squares = fill_empty_squares(img, squares_by_angle)
+            interpolated_squares = fill_empty_squares(img, squares_by_angle, scratch_masks, self._executor)
             squares_by_face = get_squares_by_face(interpolated_squares)
-            colors_by_face = determine_face_colors(img, squares_by_face)  # type hint to help LSP
+            colors_by_face = determine_face_color_ids(img, squares_by_face, hsv_buffer)  # type hint to help LSP
         except ComputerVisionException:
             return
         
@@ -567,12 +653,12 @@ class ImageToCube:
                 self.state -= 1
         
         # go through each thing in the current state
-        for face_loc, (cube_face, rotation) in ImageToCube.ROTATION_ORDER[self.state % 6].items():
+        for face_loc, cube_face, transform in ImageToCube.ROTATION_TABLE[self.state % 6]:
 
             # apply needed transformations to be able to add the guess
             if not face_loc in colors_by_face:
                 continue
-            current_face_guess = ImageToCube.interpret_face_guess(cube_face, rotation, colors_by_face[face_loc])
+            current_face_guess = transform(colors_by_face[face_loc])
 
             # incompatible N value
             try:
@@ -580,27 +666,37 @@ class ImageToCube:
             except ValueError:
                 return
             
-            # adds guess to array
-            if (existing_guesses := self.cube_guesses[cube_face.value]) is not None:
-                self.cube_guesses[cube_face.value] = np.concatenate((existing_guesses, current_face_guess), axis=2)
-            else:
-                self.cube_guesses[cube_face.value] = current_face_guess
+            # adds guess to the votes
+            if not self.frozen_faces[cube_face.value]:
+                self.add_guess(cube_face, current_face_guess[:, :, 0])
+
+    def add_guess(self, face: Face, face_guess: np.ndarray) -> None:
+        """ Adds a guess of color ids for a face to the votes, freezing the face once every square has a clear winner. """
+        counts, first_seen = self.color_counts[face.value], self.first_seen[face.value]
+        rows, cols = np.nonzero(face_guess >= 0)
+        color_ids = face_guess[rows, cols]
+        first_seen[rows, cols, color_ids] = np.where(counts[rows, cols, color_ids] == 0, self.guess_counts[face.value], 
+                                                     first_seen[rows, cols, color_ids])
+        np.add.at(counts, (rows, cols, color_ids), 1)
+        self.guess_counts[face.value] += 1
+
+        # the face is frozen once every square is far enough ahead of its runner-up
+        runner_up, leader = np.moveaxis(np.partition(counts, -2, axis=2)[..., -2:], 2, 0)
+        self.frozen_faces[face.value] = bool((leader - runner_up >= FROZEN_VOTE_MARGIN).all())
 
     def get_guess(self, face: Face) -> np.ndarray:
-        """ Determines the most likely setup of a face given already guessed colors. """
-        temp_face_arr = [[None] * self.N for _ in range(self.N)]
-        if self.cube_guesses[face.value] is not None:
-            for i in range(self.N):
-                for j in range(self.N):
-                    not_none_colors = [x for x in self.cube_guesses[face.value][i, j] if x is not None]
-                    temp_face_arr[i][j] = mode(not_none_colors) if not_none_colors else None
-        return np.array(temp_face_arr)
+        """ Determines the most likely setup of a face given already guessed colors, as color ids. """
+        counts, first_seen = self.color_counts[face.value], self.first_seen[face.value]
+
+        # most common color in each square, ties going to the color that was seen first
+        most_common = np.argmax(counts * (self.guess_counts[face.value] + 1) - first_seen, axis=2)
+        return np.where(counts.max(axis=2) > 0, most_common, -1)
 
     def create_cube(self) -> Cube:
         """ Uses a voting method to determine the most likely cube read. """
         most_voted_guesses = [None] * 6
         for face in list(Face):
-            most_voted_guesses[face.value] = self.get_guess(face)
+            most_voted_guesses[face.value] = COLOR_LIST[self.get_guess(face)]
         if self.N == 3:
             return Cube3x3(scramble=most_voted_guesses)
         return Cube(self.N, scramble=most_voted_guesses)
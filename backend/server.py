@@ -1,12 +1,20 @@
-import json
-import base64
 import asyncio
-from typing import Callable
+from functools import lru_cache
+from itertools import chain, repeat
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 
 import cv2
+import orjson
 import websockets
 import numpy as np
 
+# uvloop is optional, the default asyncio event loop is used without it
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from pycubing import Cube
 from cv import ImageToCube, cap_img
 from pycubing.solver.solver3x3 import (
@@ -21,6 +29,11 @@ from pycubing.solver import PIPELINE_3x3, PIPELINE_2x2, PIPELINE_NxN, PIPELINE_N
 from pycubing.utils import SolvePipeline, convert_3x3_moves_to_2x2, convert_3x3_moves_to_NxN, get_letter_dist_layer_width, get_move, clean_moves
 
 FUNCTION_LIST_ATTR = "_SolvePipeline__funcs"
+PIPELINE_FUNCS = {  # the functions of each pipeline, read out of the name-mangled attribute once
+    pipeline: getattr(pipeline, FUNCTION_LIST_ATTR) for pipeline in (PIPELINE_2x2, PIPELINE_3x3, PIPELINE_NxN, PIPELINE_NxN_3x3_STAGE)
+}
+FRAME_EXECUTOR = ThreadPoolExecutor()  # frames are read off the event loop, with at most one frame in flight per connection
+MAX_MESSAGE_SIZE = 4 * 2 ** 20  # fits a full-resolution png frame from the camera
 FUNCTION_TO_EXPLANATIONS = {
     orient_top_until_solve: "Turn the final layer until the whole cube is solved.",
     orient_centers: "Align the centers so that white is on the bottom.",
@@ -42,6 +55,11 @@ MOVE_OPPOSITES = (temp := {
     'U': 'D'
 }) | {v: k for k, v in temp.items()}
 
+# lookup tables for building TwistySim moves
+DIST_SUFFIXES = ('', '2', "'")  # indexed by clockwise quarter turns minus one
+FACE_INDICES = {letter: index for index, letter in enumerate(('R', 'L', 'F', 'B', 'U', 'D'))}
+MIDDLE_LAYER_LETTERS = ('M', 'S', 'E')
+
 def get_ttk_wide_move(letter: str, dist: int, layer: int) -> str:
     """ 
     Gets a wide move in the following form:
@@ -51,53 +69,56 @@ def get_ttk_wide_move(letter: str, dist: int, layer: int) -> str:
     """
     letter_str = letter.lower() if layer > 1 else letter
     layer_str = '' if layer <= 2 else str(layer)
-    dist_str = ['', '2', "'"][dist % 4 - 1]
-    return f"{layer_str}{letter_str}{dist_str}"
+    return layer_str + letter_str + DIST_SUFFIXES[dist % 4 - 1]
+
+# the same moves are parsed over and over during a solve
+parse_move = lru_cache(maxsize=4096)(get_letter_dist_layer_width)
+
+@lru_cache(maxsize=4096)
+def convert_move_to_ttk(m: str, N: int) -> tuple[str, ...]:
+    """
+    Convert a single move to a form which the TwistySim library can understand.
+    Solves repeat the same few moves many times, so the conversions are cached.
+    """
+    letter, dist, layer, width = parse_move(m, N)
+
+    # single layer turn or rotation, can use original move
+    if layer == 1 or layer == width == N: 
+        return (m,)
+
+    # turn of just the middle layer [MES] notation
+    if layer == N // 2 + 1 and N % 2 == 1 and width == 1:  
+        index = FACE_INDICES[letter]
+        dist_multiplier = -1 if index % 2 == 0 else 1
+        return (MIDDLE_LAYER_LETTERS[index // 2] + DIST_SUFFIXES[dist * dist_multiplier % 4 - 1],)
+
+    # the layer goes past the middle - i.e. "6R" on a 7x7
+    elif layer > N // 2: 
+        if layer == width:  # the layer comes all the way back  - like 6Rw
+
+            # turn the layer on the other side, then rotate along that layer
+            return (get_ttk_wide_move(MOVE_OPPOSITES[letter], dist, N - layer), 
+                    *get_move(MOVE_OPPOSITES[letter], -dist, N, N, N))
+
+        elif width == 1:  # single layer turn
+            if N == layer: # all the way at the end
+                return tuple(get_move(MOVE_OPPOSITES[letter], -dist, 1, 1))
+
+            # anywhere else, turn the wide layer including this layer first, then adjust the remaining layers 
+            return (get_ttk_wide_move(MOVE_OPPOSITES[letter], -dist, N - layer + 1),
+                    get_ttk_wide_move(MOVE_OPPOSITES[letter], dist, N - layer))
+        return ()
+
+    # the move is on its own layer, and is either wide or single
+    if width == 1:  # if it is a single layer, adjust the remaining layers
+        return get_ttk_wide_move(letter, dist, layer), get_ttk_wide_move(letter, -dist, layer - 1)
+    return (get_ttk_wide_move(letter, dist, layer),)
 
 def convert_moves_to_ttk(moves: list[str], N: int) -> list[str]:
     """
     Convert a list of moves to a form which the TwistySim library can understand.
     """
-    new_moves = []
-    for m in moves:
-        letter, dist, layer, width = get_letter_dist_layer_width(m, N)
-
-        # single layer turn or rotation, can use original move
-        if layer == 1 or layer == width == N: 
-            new_moves.append(m)
-            continue
-
-        # turn of just the middle layer [MES] notation
-        if layer == N // 2 + 1 and N % 2 == 1 and width == 1:  
-            index = ['R', 'L', 'F', 'B', 'U', 'D'].index(letter)
-            middle_layer_letter = ['M', 'S', 'E'][index // 2]
-            dist_multiplier = -1 if index % 2 == 0 else 1
-            dist_str = ['', '2', "'"][dist * dist_multiplier % 4 - 1]
-            new_moves.append(f"{middle_layer_letter}{dist_str}")
-
-        # the layer goes past the middle - i.e. "6R" on a 7x7
-        elif layer > N // 2: 
-            if layer == width:  # the layer comes all the way back  - like 6Rw
-
-                # turn the layer on the other side, then rotate along that layer
-                new_moves.append(get_ttk_wide_move(MOVE_OPPOSITES[letter], dist, N - layer))
-                new_moves.extend(get_move(MOVE_OPPOSITES[letter], -dist, N, N, N))
-
-            elif width == 1:  # single layer turn
-                if N == layer: # all the way at the end
-                    new_moves.extend(get_move(MOVE_OPPOSITES[letter], -dist, 1, 1))
-                else:  # anywhere else
-
-                    # turn the wide layer including this layer first, then adjust the remaining layers 
-                    new_moves.append(get_ttk_wide_move(MOVE_OPPOSITES[letter], -dist, N - layer + 1))
-                    new_moves.append(get_ttk_wide_move(MOVE_OPPOSITES[letter], dist, N - layer))
-
-        # the move is on its own layer, and is either wide or single
-        else:
-            new_moves.append(get_ttk_wide_move(letter, dist, layer))
-            if width == 1:  # if it is a single layer, adjust the remaining layers
-                new_moves.append(get_ttk_wide_move(letter, -dist, layer - 1))
-    return new_moves
+    return [*chain.from_iterable(map(convert_move_to_ttk, moves, repeat(N)))]
 
 def add_to_response(moves: list[str], func: Callable, simple_string: str, response: list[dict]) -> None:
     """ Adds a string of moves, a description, and a simple_string of the cube to the websocket message. """
@@ -107,8 +128,13 @@ def add_to_response(moves: list[str], func: Callable, simple_string: str, respon
         "simple_string": simple_string
     })
 
-def add_pipeline_to_response(cube: Cube, response: list[dict], pipeline: SolvePipeline):
-    """ Performs add_to_response for each function in a pipeline. """
+def add_pipeline_to_response(cube: Cube, response: list[dict], pipeline: SolvePipeline, 
+                             before_simple_string: Optional[str] = None) -> Optional[str]:
+    """ 
+    Performs add_to_response for each function in a pipeline. 
+    If the simple string of the cube is already known, it can be given to avoid computing it again.
+    Returns the simple string of the cube afterwards if it is known, otherwise None.
+    """
 
     # determine what modifications to do to moves, as well as which cube to move
     move_cube, move_function = cube, lambda x: x
@@ -119,33 +145,94 @@ def add_pipeline_to_response(cube: Cube, response: list[dict], pipeline: SolvePi
         if cube.N == 2: 
             move_function = convert_3x3_moves_to_2x2 
 
-    # go through each function and apply the moves
-    for func in getattr(pipeline, FUNCTION_LIST_ATTR):
-        before_simple_string = cube.to_simple_string()
-        moves = convert_moves_to_ttk(clean_moves(move_function(func(move_cube))), cube.N)
-        if different_cube:
-            cube.parse(" ".join(moves))
+    # go through each function and apply the moves, only serializing the cube again if the last step moved it
+    for func in PIPELINE_FUNCS[pipeline]:
+        if before_simple_string is None:
+            before_simple_string = cube.to_simple_string()
+        cube_moves = clean_moves(move_function(func(move_cube)))
+        moves = convert_moves_to_ttk(cube_moves, cube.N)
+        if different_cube:  # the moves are applied directly, rather than parsing them back out of a string
+            for letter, dist, layer, width in map(parse_move, cube_moves, repeat(cube.N)):
+                cube.turn(letter.upper(), dist, layer, width)
         add_to_response(moves, func, before_simple_string, response)
+        if moves:
+            before_simple_string = None
+    return before_simple_string
                     
-def base64_to_image(b64_str: str) -> cv2.Mat:
-    """ Converts a b64-encoded image (which is sent from the client) to a cv2 image """
-    np_buf = np.frombuffer(base64.b64decode(b64_str), np.uint8)
+def bytes_to_image(buf: bytes) -> cv2.Mat:
+    """ Converts an encoded image (which is sent from the client as a binary message) to a cv2 image """
+    np_buf = np.frombuffer(buf, np.uint8)
     img = cv2.imdecode(np_buf, cv2.IMREAD_COLOR)
     return cap_img(img)
 
+def solve_cube(simple_string: str) -> list[dict]:
+    """ Solves a cube given as a simple string, returning a list of moves and explanations for each step. """
+    cube = Cube.from_simple_string(simple_string)
+    response = []
+    match cube.N:
+        case 1:
+            pass
+
+        # run the 2x2 pipeline, then fix the final layer if needed
+        case 2:
+            before_simple_string = add_pipeline_to_response(cube, response, PIPELINE_2x2) or cube.to_simple_string()
+            new_moves = orient_top_until_solve(cube)
+            add_to_response(new_moves, orient_top_until_solve, before_simple_string, response)
+
+        # simply run the 3x3 pipeline
+        case 3:
+            add_pipeline_to_response(cube, response, PIPELINE_3x3)
+
+        # convert the cube to 3x3 stage, then attempt to solve it
+        case N:
+            simple_string = add_pipeline_to_response(cube, response, PIPELINE_NxN)
+            simple_string = add_pipeline_to_response(cube, response, PIPELINE_NxN_3x3_STAGE, simple_string)
+            cube_3x3 = cube.get_3x3()
+            before_simple_string = simple_string or cube.to_simple_string()
+
+            # check for parity, and adjust for it
+            try:
+                add_to_response(convert_3x3_moves_to_NxN(
+                    solve_pll_edges(cube_3x3), N
+                ), solve_pll_edges, before_simple_string, response)
+            except ParityException:
+                add_to_response(pll_parity(cube), pll_parity, before_simple_string, response)
+                before_simple_string = cube.to_simple_string()
+                add_to_response(convert_3x3_moves_to_NxN(
+                    solve_pll_edges(cube_3x3), N
+                ), solve_pll_edges, before_simple_string, response)
+    return response
+
+@lru_cache(maxsize=256)
+def solve_message(simple_string: str) -> bytes:
+    """
+    Creates the encoded "solve" message for a cube given as a simple string.
+    Cached since the same cube is often solved again, and the encoded bytes can't be mutated between requests.
+    """
+    return orjson.dumps({
+        "type": "solve", "moves": solve_cube(simple_string)
+    })
+
+def read_frame(translator: ImageToCube, buf: bytes) -> None:
+    """ Reads a single frame sent by the client into the translator, ignoring frames that cannot be read. """
+    try:  # frames that fail to decode are dropped too
+        translator.translate(bytes_to_image(buf))
+    except: 
+        pass
+
 async def handler(websocket: websockets.WebSocketServerProtocol):
     """ 
     Handle websocket messages, which can be the following types: 
     - "init": Initializes a fresh ImageToCube translator
-    - "frame": Reads a single frame from the client
+    - "frame": Reads a single frame from the client, which is sent as a binary message holding the encoded image
     - "finish": Completes the computer vision process
         - Sends a "cv_finish" message with the completed cube 
     - "solve": Solves a cube given as a simple string in the message
         - Sends a "solve" message with a list of moves and explanations
     """
-    translator = None
+    translator, pending_frame = None, None
     async for message in websocket:
-        data = json.loads(message)
+        data = {"type": "frame", "data": message} if isinstance(message, bytes) else orjson.loads(message)
         match data["type"]:
 
             # creating a new image translator
@@ -154,67 +241,32 @@ async def handler(websocket: websockets.WebSocketServerProtocol):
 
             # reading a single frame
             case "frame": 
-                if translator is not None:
-                    img = base64_to_image(data["data"])
-                    try:
-                        translator.translate(img)
-                    except: 
-                        pass
+                if translator is not None and (pending_frame is None or pending_frame.done()):  # frames that come in while busy are dropped
+                    pending_frame = asyncio.get_running_loop().run_in_executor(FRAME_EXECUTOR, read_frame, translator, data["data"])
 
             # finish the computer vision and send over the new cube
             case "finish":
                 if translator is not None:
+                    if pending_frame is not None:
+                        await pending_frame
                     cube = translator.create_cube()
-                    await websocket.send(json.dumps({
+                    await websocket.send(orjson.dumps({
                         "type": "cv_finish", "cube": cube.to_simple_string()
                     }))
 
-            # solve the cube
+            # solve the cube, off of the event loop since large cubes take a while
             case "solve":
-                cube = Cube.from_simple_string(data["simple_string"])
-                response = []
-                match cube.N:
-                    case 1:
-                        pass
-
-                    # run the 2x2 pipeline, then fix the final layer if needed
-                    case 2:
-                        add_pipeline_to_response(cube, response, PIPELINE_2x2)
-                        before_simple_string = cube.to_simple_string()
-                        new_moves = orient_top_until_solve(cube)
-                        add_to_response(new_moves, orient_top_until_solve, before_simple_string, response)
-
-                    # simply run the 3x3 pipeline
-                    case 3:
-                        add_pipeline_to_response(cube, response, PIPELINE_3x3)
-
-                    # convert the cube to 3x3 stage, then attempt to solve it
-                    case N:
-                        add_pipeline_to_response(cube, response, PIPELINE_NxN)
-                        add_pipeline_to_response(cube, response, PIPELINE_NxN_3x3_STAGE)
-                        cube_3x3 = cube.get_3x3()
-                        before_simple_string = cube.to_simple_string()
-
-                        # check for parity, and adjust for it
-                        try:
-                            add_to_response(convert_3x3_moves_to_NxN(
-                                solve_pll_edges(cube_3x3), N
-                            ), solve_pll_edges, before_simple_string, response)
-                        except ParityException:
-                            add_to_response(pll_parity(cube), pll_parity, before_simple_string, response)
-                            before_simple_string = cube.to_simple_string()
-                            add_to_response(convert_3x3_moves_to_NxN(
-                                solve_pll_edges(cube_3x3), N
-                            ), solve_pll_edges, before_simple_string, response)
+                message = await asyncio.to_thread(solve_message, data["simple_string"])
 
                 # send the final solve message to the server
-                await websocket.send(json.dumps({
-                    "type": "solve", "moves": response
-                }))
+                await websocket.send(message)
 
 async def main():
-    async with websockets.serve(handler, "", 8090):
+    # frames are already compressed images, so deflating them only costs cpu, and they can be larger than the default 1 MiB
+    async with websockets.serve(handler, "", 8090, compression=None, max_size=MAX_MESSAGE_SIZE, max_queue=32):
         await asyncio.Future()
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.install()
     asyncio.run(main())
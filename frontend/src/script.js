@@ -105,10 +105,9 @@ function sendFrames(canvas, ctx) {
   
   // send one frame
   ctx.drawImage(globalState.userVideo.video, 0, 0, canvas.width, canvas.height);
-  img = canvas.toDataURL("image/png").split(";base64,")[1];
-  globalState.webSocketConnection.socket.send(JSON.stringify({
-    type: "frame", data: img
-  }));
+  canvas.toBlob((img) => {
+    globalState.webSocketConnection.socket.send(img);  // frames go over as raw binary messages, no base64 or json
+  }, "image/png");
 
   setTimeout(() => {
     sendFrames(canvas, ctx)
@@ -438,10 +437,12 @@ function goToNextSolveStep(stepIncrement) {
 
 document.addEventListener("DOMContentLoaded", () => {
   const ws = new WebSocket("ws://localhost:8090/");
+  ws.binaryType = "arraybuffer";  // the server sends its json as binary messages
+  const decoder = new TextDecoder();
   
   // handle websocket messages coming FROM the server 
   ws.addEventListener("message", (data) => {
-    const dataObj = JSON.parse(data["data"]);
+    const dataObj = JSON.parse(decoder.decode(data["data"]));
     console.log(dataObj);
     switch (dataObj["type"]) {
       case "cv_finish":